@@ -0,0 +1,81 @@
+"""Compare the JSON and binary player state formats.
+
+Run with ``python bench_state_format.py``. Reports save time, load time and
+file size for each format at 1k and 100k players.
+"""
+import json
+import os
+import random
+import tempfile
+import time
+
+from game_engine import new_player
+from state_format import decode_players, encode_players
+from windowed_scores import add_points, new_windows
+
+SIZES = [1_000, 100_000]
+REPEATS = 3
+
+
+def make_players(n):
+    players = {}
+    for i in range(n):
+        info = new_player()
+        info['score'] = random.randint(0, 5000)
+        info['questions_answered'] = random.randint(0, 400)
+        info['correct_answers'] = random.randint(0, info['questions_answered'])
+        info['last_active'] = time.time() - random.uniform(0, 86400)
+        if i % 2:
+            # Half the players have played recently enough to carry score rings
+            info['windows'] = new_windows()
+            add_points(info['windows'], random.randint(10, 15), info['last_active'])
+        players[f"Student {i:06d}"] = info
+    return players
+
+
+def save_json(path, players):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(players, f, ensure_ascii=False, indent=2)
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_binary(path, players):
+    with open(path, 'wb') as f:
+        f.write(encode_players(players))
+
+
+def load_binary(path):
+    with open(path, 'rb') as f:
+        return decode_players(f.read())
+
+
+def best_of(fn, *args):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    formats = [("json", save_json, load_json), ("binary", save_binary, load_binary)]
+    print(f"{'players':>8} {'format':>7} {'save ms':>9} {'load ms':>9} {'size KiB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in SIZES:
+            players = make_players(n)
+            for name, save, load in formats:
+                path = os.path.join(tmp, f"players.{name}")
+                save_time = best_of(save, path, players)
+                load_time = best_of(load, path)
+                assert load(path) == players
+                size = os.path.getsize(path) / 1024
+                print(f"{n:>8} {name:>7} {save_time * 1000:>9.1f} {load_time * 1000:>9.1f} {size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Export printable/offline question banks from the game engine.
+
+Examples::
+
+    python export_questions.py --count 1000000 --seed 7 --output bank.csv
+    python export_questions.py --topics Fractions Algebra --format jsonl --output algebra.jsonl
+
+Questions are generated in fixed-size chunks across a process pool. Chunk
+``i`` is always generated with the seed ``"<seed>:<i>"``, so the output for a
+given seed is identical whatever the worker count. Finished chunks are
+written to disk in order as they arrive; only a few chunks are held in
+memory at once.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from game_engine import MathGame
+
+FORMATS = ("csv", "jsonl", "parquet")
+COLUMNS = ["topic", "question", "option_a", "option_b", "option_c", "option_d", "correct", "answer"]
+LETTERS = "abcd"
+
+_game = None
+
+
+def _question_row(question):
+    options = [str(opt) for opt in question["options"]]
+    return [question["topic"], question["question"], *options,
+            LETTERS[question["correct"]], options[question["correct"]]]
+
+
+def generate_chunk(topics, count, seed, chunk_index, fmt):
+    """Generate one chunk of questions, already encoded for ``fmt``."""
+    global _game
+    if _game is None:
+        _game = MathGame()
+    random.seed(f"{seed}:{chunk_index}")
+    rows = [_question_row(_game.get_random_question(random.choice(topics))) for _ in range(count)]
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue()
+    if fmt == "jsonl":
+        return "".join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+    return {name: list(column) for name, column in zip(COLUMNS, zip(*rows))}
+
+
+def _chunks(count, chunk_size):
+    for index, start in enumerate(range(0, count, chunk_size)):
+        yield index, min(chunk_size, count - start)
+
+
+def export(output, topics, count, seed, fmt="csv", workers=None, chunk_size=10_000):
+    """Write ``count`` questions drawn from ``topics`` to ``output``."""
+    if fmt == "parquet" and pa is None:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+    workers = workers or os.cpu_count() or 1
+
+    if fmt == "parquet":
+        schema = pa.schema([(name, pa.string()) for name in COLUMNS])
+        writer = pq.ParquetWriter(output, schema)
+        write = lambda chunk: writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+        close = writer.close
+    else:
+        f = open(output, "w", encoding="utf-8", newline="")
+        if fmt == "csv":
+            csv.writer(f).writerow(COLUMNS)
+        write = f.write
+        close = f.close
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for index, size in _chunks(count, chunk_size):
+                pending.append(pool.submit(generate_chunk, topics, size, seed, index, fmt))
+                # Keep a bounded window of chunks in flight and write them in order
+                if len(pending) >= workers * 2:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    finally:
+        close()
+
+
+def _positive_int(text):
+    """argparse type for counts, chunk sizes and worker counts."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {text!r}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def main(argv=None):
+    topics = list(MathGame().topics)
+    parser = argparse.ArgumentParser(description="Export NJSLA Math Challenge question banks.")
+    parser.add_argument("--topics", nargs="+", choices=topics, default=topics,
+                        help="Topics to draw from (default: all)")
+    parser.add_argument("--count", type=_positive_int, default=1000, help="Number of questions")
+    parser.add_argument("--seed", default="0", help="Seed; the same seed gives the same bank")
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="Output format (default: from the output file extension, else csv)")
+    parser.add_argument("--output", required=True, help="Output file path")
+    parser.add_argument("--workers", type=_positive_int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=_positive_int, default=10_000, help="Questions per worker task")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.output)[1].lstrip(".").lower()
+        fmt = ext if ext in FORMATS else "csv"
+    try:
+        export(args.output, args.topics, args.count, args.seed, fmt, args.workers, args.chunk_size)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
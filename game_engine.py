@@ -0,0 +1,623 @@
+"""Headless game engine: question generation, answer checking and scoring.
+
+Nothing in here imports Streamlit, so the engine can be used from scripts,
+notebooks and bulk simulations as well as from ``app.py``.
+"""
+import ast
+import json
+import keyword
+import os
+import random
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from math import gcd
+
+from question_space import QuestionSpace, ReplayDraw, pick
+from response_times import new_histogram, record_time
+from windowed_scores import add_points, new_windows
+
+# Scoring rules
+BASE_POINTS = 10
+MAX_SPEED_BONUS = 5
+SPEED_ROUND_POINTS = 5
+
+# Missed questions kept per session for Review Mistakes
+MISTAKE_REVIEW_CAPACITY = 25
+
+WORD_PROBLEMS_FILE = os.path.join(os.path.dirname(__file__), 'word_problems.json')
+
+
+# Formulas in word_problems.json may only do arithmetic on numbers and named values
+_FORMULA_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Name, ast.Constant, ast.Load,
+                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.UAdd, ast.USub)
+
+
+def _compile_formula(expr, names):
+    """Compile an answer/derived formula once into a plain function of the named values.
+
+    The formula is parsed and checked against ``_FORMULA_NODES`` first; any
+    other syntax, or a name that is not a declared value, raises ValueError.
+    """
+    try:
+        tree = ast.parse(expr, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"formula {expr!r} is not an expression") from e
+    for node in ast.walk(tree):
+        if not isinstance(node, _FORMULA_NODES):
+            raise ValueError(f"formula {expr!r} uses unsupported {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise ValueError(f"formula {expr!r} uses unknown name {node.id!r}")
+        if isinstance(node, ast.Constant) and type(node.value) not in (int, float):
+            raise ValueError(f"formula {expr!r} uses non-numeric constant {node.value!r}")
+    # Build the lambda from the checked tree rather than from source text
+    args = ast.arguments(posonlyargs=[], args=[ast.arg(arg=name) for name in names], vararg=None,
+                         kwonlyargs=[], kw_defaults=[], kwarg=ast.arg(arg='_'), defaults=[])
+    function = ast.fix_missing_locations(ast.Expression(ast.Lambda(args=args, body=tree.body)))
+    return eval(compile(function, f"<formula {expr!r}>", 'eval'), {"__builtins__": {}})
+
+
+def _compile_template(spec):
+    """Turn one word_problems.json entry into parameter sequences and compiled formulas."""
+    params = []
+    for name, param in spec["params"].items():
+        if "choices" in param:
+            params.append((name, tuple(param["choices"]), 0))
+        elif "decimals" in param:
+            # Decimal parameters are enumerated as integer steps of 10**-decimals
+            scale = 10 ** param["decimals"]
+            params.append((name, range(round(param["min"] * scale), round(param["max"] * scale) + 1),
+                           scale))
+        else:
+            params.append((name, range(param["min"], param["max"] + 1), 0))
+
+    names = list(spec["params"])
+    try:
+        derived = []
+        for name in [*names, *spec.get("derived", {})]:
+            if not name.isidentifier() or keyword.iskeyword(name) or name == '_':
+                raise ValueError(f"{name!r} is not a valid value name")
+        for name, expr in spec.get("derived", {}).items():
+            derived.append((name, _compile_formula(expr, names)))
+            names.append(name)
+        answer = _compile_formula(spec["answer"], names)
+    except ValueError as e:
+        raise ValueError(f"Invalid word problem template {spec['id']!r}: {e}") from e
+
+    template = {
+        "id": spec["id"],
+        "text": spec["text"],
+        "params": tuple(params),
+        "derived": tuple(derived),
+        "answer": answer
+    }
+    # Dry run so a bad template fails at import rather than mid-game
+    values = _template_values(template, tuple(random.choice(seq) for _, seq, _ in params))
+    try:
+        spec["text"].format(**values)
+        template["answer"](**values)
+    except Exception as e:
+        raise ValueError(f"Invalid word problem template {spec['id']!r}: {e}") from e
+    return template
+
+
+def _template_values(template, digits):
+    """Scale a template's drawn parameter ``digits`` and compute its derived values."""
+    values = {name: value / scale if scale else value
+              for (name, _, scale), value in zip(template["params"], digits)}
+    for name, formula in template["derived"]:
+        values[name] = formula(**values)
+    return values
+
+
+def load_word_problem_index(path=WORD_PROBLEMS_FILE):
+    """Compile templates from ``path`` into ``{(topic, difficulty): [template, ...]}``.
+
+    ``(topic, None)`` holds every template for the topic.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        specs = json.load(f)["templates"]
+    index = {}
+    for spec in specs:
+        template = _compile_template(spec)
+        index.setdefault((spec["topic"], spec["difficulty"]), []).append(template)
+        index.setdefault((spec["topic"], None), []).append(template)
+    return index
+
+
+WORD_PROBLEM_INDEX = load_word_problem_index()
+
+
+class _OrderedPairs:
+    """Every ``(a, b)`` with ``a`` in ``firsts``, ``b`` in ``seconds`` and ``a >= b``, as a lazy sequence.
+
+    Pairs are grouped by ``b``; ``firsts`` must be a step-1 range.
+    """
+
+    def __init__(self, firsts, seconds):
+        self.firsts = firsts
+        self.seconds = seconds
+        # index of the first pair for each b
+        self._starts = []
+        total = 0
+        for b in seconds:
+            self._starts.append(total)
+            total += len(range(max(firsts.start, b), firsts.stop))
+        self._len = total
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        i = bisect_right(self._starts, index) - 1
+        b = self.seconds[i]
+        return max(self.firsts.start, b) + index - self._starts[i], b
+
+
+_FRACTION_DENOMINATORS = (2, 3, 4, 5, 6, 8, 10, 12)
+_SUBTRACTION_PAIRS = {denom: tuple((a, b) for a in range(1, denom) for b in range(1, a + 1))
+                      for denom in _FRACTION_DENOMINATORS}
+_RATIO_SCENARIOS = (
+    "A recipe calls for {} cups of flour and {} cups of sugar. What is the ratio of flour to sugar?",
+    "In a class of {} students, {} are boys. What is the ratio of boys to total students?",
+    "A car travels {} miles in {} hours. What is the ratio of miles to hours?"
+)
+_WORD_PROBLEM_TEMPLATES = WORD_PROBLEM_INDEX[("Word Problems", None)]
+
+# Every question a topic can ask, split into segments weighted like the
+# original random.choice of operation, denominator or question type, so a
+# QuestionCursor can serve the whole topic before anything repeats.
+QUESTION_SPACES = {space.name: space for space in (
+    QuestionSpace("Fractions", [
+        # Each operation a quarter of the time; +/- then pick a denominator
+        *((('+', denom), 1, (range(1, denom), range(1, denom))) for denom in _FRACTION_DENOMINATORS),
+        # Only pairs with num1 >= num2, so no two indices give the same question
+        *((('-', denom), 1, (_SUBTRACTION_PAIRS[denom],)) for denom in _FRACTION_DENOMINATORS),
+        (('*', None), 8, (range(1, 6), range(2, 6), range(1, 6), range(2, 6))),
+        (('/', None), 8, (range(1, 6), range(2, 6), range(1, 6), range(2, 6))),
+    ]),
+    QuestionSpace("Decimals", [
+        # Operands in hundredths: 1.00-50.00 and 1.00-20.00
+        ('+', 1, (range(100, 5001), range(100, 2001))),
+        # Only pairs with num1 >= num2, so no two indices give the same question
+        ('-', 1, (_OrderedPairs(range(100, 5001), range(100, 2001)),)),
+        ('*', 1, (range(10, 101), range(10, 101))),
+        ('/', 1, (range(10, 101), range(100, 1001))),
+    ]),
+    QuestionSpace("Ratios & Proportions", [
+        (None, 1, (_RATIO_SCENARIOS, range(2, 13), range(2, 13))),
+    ]),
+    QuestionSpace("Geometry", [
+        ("area_rectangle", 1, (range(5, 16), range(3, 13))),
+        ("area_triangle", 1, (range(6, 17), range(4, 13))),
+        ("perimeter", 1, (range(5, 16), range(3, 13))),
+        ("volume", 1, (range(3, 9), range(3, 9), range(3, 9))),
+    ]),
+    QuestionSpace("Algebra", [
+        (operation, 1, (range(1, 21), range(1, 31) if operation in ['+', '-'] else range(2, 9)))
+        for operation in ['+', '-', '*', '/']
+    ]),
+    QuestionSpace("Statistics", [
+        # Mode questions also pick which value repeats
+        ((question_type, size), 1, [range(10, 51)] * size + ([range(size)] if question_type == "mode" else []))
+        for question_type in ["mean", "median", "mode", "range"] for size in range(5, 9)
+    ]),
+    QuestionSpace("Word Problems", [
+        (template["id"], 1, tuple(seq for _, seq, _ in template["params"]))
+        for template in _WORD_PROBLEM_TEMPLATES
+    ]),
+)}
+# Segment weights restricting word problems to one difficulty
+_WORD_PROBLEM_WEIGHTS = {
+    difficulty: tuple(int(template in templates) for template in _WORD_PROBLEM_TEMPLATES)
+    for (topic, difficulty), templates in WORD_PROBLEM_INDEX.items() if topic == "Word Problems"
+}
+_WORD_PROBLEMS_BY_ID = {template["id"]: template for template in _WORD_PROBLEM_TEMPLATES}
+
+
+class MathGame:
+    def __init__(self):
+        self.topics = {
+            "Fractions": self.generate_fraction_question,
+            "Decimals": self.generate_decimal_question,
+            "Ratios & Proportions": self.generate_ratio_question,
+            "Geometry": self.generate_geometry_question,
+            "Algebra": self.generate_algebra_question,
+            "Statistics": self.generate_statistics_question,
+            "Word Problems": self.generate_word_problem
+        }
+
+    def generate_fraction_question(self, cursor=None):
+        # +/- use the same denominator for easier computation
+        (operation, denom), values, qid = pick(cursor, QUESTION_SPACES["Fractions"])
+
+        if operation == '+':
+            num1, num2 = values
+            result = (num1 + num2) / denom
+            question = f"What is {num1}/{denom} + {num2}/{denom}?"
+
+        elif operation == '-':
+            (num1, num2), = values
+            result = (num1 - num2) / denom
+            question = f"What is {num1}/{denom} - {num2}/{denom}?"
+
+        elif operation == '*':
+            num1, denom1, num2, denom2 = values
+            result = (num1 * num2) / (denom1 * denom2)
+            question = f"What is {num1}/{denom1} × {num2}/{denom2}?"
+
+        else:  # division
+            num1, denom1, num2, denom2 = values
+            result = (num1 * denom2) / (denom1 * num2)
+            question = f"What is {num1}/{denom1} ÷ {num2}/{denom2}?"
+
+        # Generate multiple choice options
+        correct = result
+        options = [correct]
+        while len(options) < 4:
+            wrong = correct + random.uniform(-0.5, 0.5)
+            if wrong > 0 and wrong not in options:
+                options.append(wrong)
+
+        random.shuffle(options)
+        correct_index = options.index(correct)
+
+        return {
+            "question": question,
+            "options": [f"{opt:.3f}".rstrip('0').rstrip('.') for opt in options],
+            "correct": correct_index,
+            "topic": "Fractions",
+            "qid": qid
+        }
+
+    def generate_decimal_question(self, cursor=None):
+        operation, values, qid = pick(cursor, QUESTION_SPACES["Decimals"])
+        num1, num2 = values[0] if operation == '-' else values
+
+        if operation in ['+', '-']:
+            num1, num2 = num1 / 100, num2 / 100
+
+        if operation == '+':
+            result = num1 + num2
+            question = f"What is {num1} + {num2}?"
+        elif operation == '-':
+            result = num1 - num2
+            question = f"What is {num1} - {num2}?"
+        elif operation == '*':
+            num1, num2 = num1 / 10, num2 / 10
+            result = num1 * num2
+            question = f"What is {num1} × {num2}?"
+        else:  # division
+            num2, result = num1 / 10, num2 / 100
+            num1 = num2 * result
+            question = f"What is {num1:.2f} ÷ {num2}?"
+
+        correct = round(result, 2)
+        options = [correct]
+        while len(options) < 4:
+            wrong = round(correct + random.uniform(-5, 5), 2)
+            if wrong > 0 and wrong not in options:
+                options.append(wrong)
+
+        random.shuffle(options)
+        correct_index = options.index(correct)
+
+        return {
+            "question": question,
+            "options": options,
+            "correct": correct_index,
+            "topic": "Decimals",
+            "qid": qid
+        }
+
+    def generate_ratio_question(self, cursor=None):
+        _, (scenario, num1, num2), qid = pick(cursor, QUESTION_SPACES["Ratios & Proportions"])
+
+        # Simplify the ratio
+        common = gcd(num1, num2)
+        simplified_ratio = f"{num1 // common}:{num2 // common}"
+
+        question = scenario.format(num1, num2)
+
+        options = [simplified_ratio]
+        while len(options) < 4:
+            wrong_num1 = random.randint(1, 15)
+            wrong_num2 = random.randint(1, 15)
+            wrong_ratio = f"{wrong_num1}:{wrong_num2}"
+            if wrong_ratio not in options:
+                options.append(wrong_ratio)
+
+        random.shuffle(options)
+        correct_index = options.index(simplified_ratio)
+
+        return {
+            "question": question,
+            "options": options,
+            "correct": correct_index,
+            "topic": "Ratios & Proportions",
+            "qid": qid
+        }
+
+    def generate_geometry_question(self, cursor=None):
+        q_type, values, qid = pick(cursor, QUESTION_SPACES["Geometry"])
+
+        if q_type == "area_rectangle":
+            length, width = values
+            area = length * width
+            question = f"What is the area of a rectangle with length {length} units and width {width} units?"
+            unit = "square units"
+
+        elif q_type == "area_triangle":
+            base, height = values
+            area = 0.5 * base * height
+            question = f"What is the area of a triangle with base {base} units and height {height} units?"
+            unit = "square units"
+
+        elif q_type == "perimeter":
+            length, width = values
+            area = 2 * (length + width)
+            question = f"What is the perimeter of a rectangle with length {length} units and width {width} units?"
+            unit = "units"
+
+        else:  # volume
+            length, width, height = values
+            area = length * width * height
+            question = f"What is the volume of a rectangular prism with length {length}, width {width}, and height {height} units?"
+            unit = "cubic units"
+
+        correct = area
+        options = [f"{correct} {unit}"]
+        while len(options) < 4:
+            wrong = correct + random.randint(-20, 20)
+            if wrong > 0:
+                wrong_option = f"{wrong} {unit}"
+                if wrong_option not in options:
+                    options.append(wrong_option)
+
+        random.shuffle(options)
+        correct_index = options.index(f"{correct} {unit}")
+
+        return {
+            "question": question,
+            "options": options,
+            "correct": correct_index,
+            "topic": "Geometry",
+            "qid": qid
+        }
+
+    def generate_algebra_question(self, cursor=None):
+        # Simple one-step equations
+        operation, (x_value, constant), qid = pick(cursor, QUESTION_SPACES["Algebra"])
+
+        if operation == '+':
+            result = x_value + constant
+            question = f"Solve for x: x + {constant} = {result}"
+        elif operation == '-':
+            result = x_value + constant
+            question = f"Solve for x: x - {constant} = {x_value}"
+        elif operation == '*':
+            result = x_value * constant
+            question = f"Solve for x: {constant}x = {result}"
+        else:  # division
+            result = x_value * constant
+            question = f"Solve for x: x ÷ {constant} = {x_value}"
+
+        correct = x_value
+        options = [correct]
+        while len(options) < 4:
+            wrong = random.randint(1, 30)
+            if wrong not in options:
+                options.append(wrong)
+
+        random.shuffle(options)
+        correct_index = options.index(correct)
+
+        return {
+            "question": question,
+            "options": options,
+            "correct": correct_index,
+            "topic": "Algebra",
+            "qid": qid
+        }
+
+    def generate_statistics_question(self, cursor=None):
+        # Generate a dataset (mode questions also pick which value repeats)
+        (question_type, _), data, qid = pick(cursor, QUESTION_SPACES["Statistics"])
+        data = list(data)
+        if question_type == "mode":
+            mode_index = data.pop()
+
+        if question_type == "mean":
+            correct = sum(data) / len(data)
+            question = f"What is the mean of this dataset: {data}?"
+        elif question_type == "median":
+            sorted_data = sorted(data)
+            n = len(sorted_data)
+            if n % 2 == 0:
+                correct = (sorted_data[n // 2 - 1] + sorted_data[n // 2]) / 2
+            else:
+                correct = sorted_data[n // 2]
+            question = f"What is the median of this dataset: {data}?"
+        elif question_type == "mode":
+            # Ensure there's a clear mode
+            mode_value = data[mode_index]
+            data.append(mode_value)
+            correct = mode_value
+            question = f"What is the mode of this dataset: {data}?"
+        else:  # range
+            correct = max(data) - min(data)
+            question = f"What is the range of this dataset: {data}?"
+
+        options = [correct]
+        while len(options) < 4:
+            if question_type in ["mean", "median"]:
+                wrong = correct + random.uniform(-5, 5)
+                wrong = round(wrong, 1)
+            else:
+                wrong = correct + random.randint(-10, 10)
+
+            if wrong > 0 and wrong not in options:
+                options.append(wrong)
+
+        random.shuffle(options)
+        correct_index = options.index(correct)
+
+        return {
+            "question": question,
+            "options": options,
+            "correct": correct_index,
+            "topic": "Statistics",
+            "qid": qid
+        }
+
+    def generate_word_problem(self, cursor=None, difficulty=None):
+        # Templates are compiled once at import; see word_problems.json
+        template_id, digits, qid = pick(cursor, QUESTION_SPACES["Word Problems"],
+                                        _WORD_PROBLEM_WEIGHTS[difficulty])
+        template = _WORD_PROBLEMS_BY_ID[template_id]
+        values = _template_values(template, digits)
+
+        question = template["text"].format(**values)
+        correct = template["answer"](**values)
+
+        correct = round(correct, 2)
+        options = [correct]
+        while len(options) < 4:
+            wrong = correct + random.uniform(-10, 10)
+            wrong = round(wrong, 2)
+            if wrong > 0 and wrong not in options:
+                options.append(wrong)
+
+        random.shuffle(options)
+        correct_index = options.index(correct)
+
+        return {
+            "question": question,
+            "options": options,
+            "correct": correct_index,
+            "topic": "Word Problems",
+            "qid": qid
+        }
+
+    def replay_question(self, qid):
+        """Rebuild the question with id ``qid`` (wrong options and their order are drawn afresh)."""
+        topic, segment, index = qid
+        return self.topics[topic](ReplayDraw(segment, index))
+
+    def get_random_question(self, topic=None, cursor=None):
+        """Return a question; with a ``QuestionCursor`` the player never sees a repeat
+        until a topic's parameter space is exhausted."""
+        if topic and topic in self.topics:
+            return self.topics[topic](cursor)
+        else:
+            topic = random.choice(list(self.topics.keys()))
+            return self.topics[topic](cursor)
+
+
+def new_player(join_time=None):
+    """Return a fresh player stats dict."""
+    return {
+        "score": 0,
+        "questions_answered": 0,
+        "correct_answers": 0,
+        "join_time": join_time or datetime.now().strftime("%H:%M:%S")
+    }
+
+
+def check_answer(question, selected_answer):
+    """Return True if ``selected_answer`` (an option value) is the correct one."""
+    return question['options'].index(selected_answer) == question['correct']
+
+
+def new_mistake_log(capacity=MISTAKE_REVIEW_CAPACITY):
+    """Return an empty fixed-capacity ring buffer of missed question ids."""
+    return deque(maxlen=capacity)
+
+
+def log_mistake(log, question):
+    """Add a missed question to the back of ``log`` as its compact ``qid``.
+
+    A question already in the log moves to the back. Once ``log`` is full the
+    oldest mistake is dropped.
+    """
+    qid = question['qid']
+    if qid in log:
+        log.remove(qid)
+    log.append(qid)
+
+
+def next_mistake(log, game):
+    """Rebuild the oldest missed question with ``game``, or None if there are none.
+
+    The mistake stays in the log until :func:`clear_mistake` is called.
+    """
+    if not log:
+        return None
+    return game.replay_question(log[0])
+
+
+def clear_mistake(log, question):
+    """Remove a reviewed question from ``log`` once it was answered correctly."""
+    if question['qid'] in log:
+        log.remove(question['qid'])
+
+
+def speed_bonus(time_taken):
+    """Speed bonus for a correct answer: 5 points at under a second, down to 0."""
+    return max(0, MAX_SPEED_BONUS - int(time_taken))
+
+
+def score_answer(is_correct, time_taken):
+    """Return ``(points, speed_bonus)`` for a Quick Challenge answer."""
+    if not is_correct:
+        return 0, 0
+    bonus = speed_bonus(time_taken)
+    return BASE_POINTS + bonus, bonus
+
+
+def record_answer(player, is_correct, time_taken, topic=None):
+    """Apply one Quick Challenge answer to a player dict and return the score tuple.
+
+    With ``topic``, the answer time is also counted in the player's
+    response-time histogram for that topic.
+    """
+    points, bonus = score_answer(is_correct, time_taken)
+    player['questions_answered'] += 1
+    if topic is not None:
+        histograms = player.setdefault('response_times', {})
+        if topic not in histograms:
+            histograms[topic] = new_histogram()
+        record_time(histograms[topic], time_taken)
+    if is_correct:
+        player['correct_answers'] += 1
+        player['score'] += points
+        add_points(player.setdefault('windows', new_windows()), points)
+    return points, bonus
+
+
+def record_speed_round(player, final_score, questions_answered):
+    """Add a finished Speed Round's totals to a player dict."""
+    player['score'] += final_score
+    player['questions_answered'] += questions_answered
+    if final_score:
+        add_points(player.setdefault('windows', new_windows()), final_score)
+    return player
+
+
+def simulate(players, answers):
+    """Apply a bulk stream of Quick Challenge answers to ``players``.
+
+    ``answers`` is an iterable of ``(player_name, is_correct, time_taken)``
+    or ``(player_name, is_correct, time_taken, topic)`` tuples. Each answer
+    goes through :func:`record_answer`, so scoring changes show up here
+    exactly as in the app. Unknown players are created on first answer.
+    ``players`` is updated in place and returned.
+    """
+    for name, is_correct, time_taken, *topic in answers:
+        player = players.get(name)
+        if player is None:
+            player = players[name] = new_player()
+        record_answer(player, is_correct, time_taken, topic[0] if topic else None)
+    return players
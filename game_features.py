@@ -5,7 +5,10 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from shared_state import load_players, reset_players
+from shared_scoreboard import get_scoreboard
+from response_times import merge_histograms, summarize
+from shared_state import add_players, load_players, parse_roster, reset_players
+from windowed_scores import LEADERBOARD_WINDOWS, windowed_leaderboard
 
 
 @st.cache_data(ttl=3)  # Cache for 3 seconds to avoid too frequent disk reads
@@ -101,6 +104,44 @@ def show_analytics():
         except:
             st.metric("Top Scorer", "-")
 
+    # Rolling-window leaderboard from the bucketed score counters
+    st.subheader("🕒 Rolling Leaderboard")
+    windows = [label for label, spec in LEADERBOARD_WINDOWS.items() if spec is not None]
+    window = st.selectbox("Window:", windows)
+    standings = pd.DataFrame(windowed_leaderboard(players, window), columns=['player_name', 'points'])
+    fig_window = px.bar(
+        standings,
+        x='player_name',
+        y='points',
+        title=f"Points Scored ({window})",
+        color='points',
+        color_continuous_scale='viridis'
+    )
+    fig_window.update_layout(showlegend=False)
+    st.plotly_chart(fig_window, use_container_width=True)
+
+    # Answer-time percentiles from the per player x topic histograms
+    st.subheader("⏱️ Answer Times")
+    by_topic = {}
+    player_rows = []
+    for name, data in players.items():
+        for topic, histogram in (data.get('response_times') or {}).items():
+            by_topic.setdefault(topic, []).append(histogram)
+            player_rows.append({"Player": name, "Topic": topic, **summarize(histogram)})
+    if player_rows:
+        # Room-wide view: merge every player's histogram per topic
+        room_rows = [{"Topic": topic, **summarize(merge_histograms(histograms))}
+                     for topic, histograms in by_topic.items()]
+        columns = {"answers": "Answers", "p50": "p50 (s)", "p90": "p90 (s)", "p99": "p99 (s)"}
+        st.markdown("**Whole room by topic**")
+        st.dataframe(pd.DataFrame(room_rows).rename(columns=columns).round(2),
+                     use_container_width=True, hide_index=True)
+        st.markdown("**By player and topic**")
+        st.dataframe(pd.DataFrame(player_rows).rename(columns=columns).round(2),
+                     use_container_width=True, hide_index=True)
+    else:
+        st.info("No answer times recorded yet.")
+
     # Detailed player stats table
     st.subheader("📋 Detailed Statistics")
     display_df = players_df[['score', 'questions_answered', 'correct_answers', 'accuracy']].copy()
@@ -120,8 +161,12 @@ def reset_game():
         if st.button("🗑️ Reset All Data", type="primary"):
             # Reset shared file as well as local session state
             reset_players()
+            scoreboard = get_scoreboard()
+            if scoreboard is not None:
+                scoreboard.clear()
             # Clear local session state keys that may store game state
-            for key in ('players', 'current_player', 'question_data', 'leaderboard'):
+            for key in ('players', 'current_player', 'question_data', 'leaderboard', 'mistakes',
+                        'review_question'):
                 if key in st.session_state:
                     del st.session_state[key]
             st.success("✅ Game data has been reset!")
@@ -158,6 +203,7 @@ def show_help():
            - **Topic Focus**: Practice specific math topics
            - **Speed Round**: 60-second challenge
            - **Tournament**: Compete with friends
+           - **Review Mistakes**: Retry questions you missed
         3. **Start Playing**: Click "New Question" to begin
 
         ### Tips
@@ -207,6 +253,34 @@ def show_help():
         """)
 
 
+def _decode_roster(data):
+    """Decode an uploaded roster: UTF-8 (BOM stripped), else Excel's Windows cp1252."""
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1252', errors='replace')
+
+
+def show_roster_registration():
+    """Sidebar expander for registering a whole class roster in one write."""
+    with st.sidebar.expander("📋 Register Class Roster"):
+        uploaded = st.file_uploader("Roster CSV", type=["csv", "txt"])
+        pasted = st.text_area("...or paste one name per line:")
+        if st.button("Register Roster"):
+            text = _decode_roster(uploaded.getvalue()) if uploaded else pasted
+            try:
+                names = parse_roster(text)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            if not names:
+                st.warning("No names found in roster.")
+                return
+            players, added = add_players(names)
+            st.session_state.players = players
+            st.success(f"Registered {len(added)} new players ({len(names) - len(added)} already joined).")
+
+
 def show_navigation():
     st.sidebar.markdown("---")
     st.sidebar.subheader("📊 Analytics & Settings")
@@ -0,0 +1,148 @@
+"""Enumerated question parameter spaces with per-player no-repeat cursors.
+
+Every topic in ``game_engine`` has a :class:`QuestionSpace`: a few weighted
+*segments* (for example "fraction addition with denominator 8"), each the
+cartesian product of a few sequences. Segments are never materialised: an
+index in ``range(size)`` is decoded mixed-radix into one value per sequence.
+
+Without a cursor, :func:`pick` chooses a segment by weight and draws
+uniformly inside it, like the old ``random.choice``/``random.randint`` calls.
+With a :class:`QuestionCursor`, each segment is walked in a pseudo-random
+full-period order (an LCG mod 2**k plus a bijective scramble, cycle-walked
+down to ``size``), and segments are chosen by weight among those with
+combinations left. A player therefore sees every question in a topic once
+before any repeats, while the mix of segments stays as weighted until small
+segments run out. A cursor keeps a handful of integers per segment it has
+touched, independent of how many questions were served.
+
+Every pick also returns a question id ``(space name, segment, index)``;
+passing a :class:`ReplayDraw` of that segment and index as the cursor draws
+the same parameters again, so a question can be stored as three small values
+and rebuilt on demand.
+"""
+import random
+from itertools import accumulate
+
+
+def _decode(index, choices):
+    values = []
+    for seq in choices:
+        index, digit = divmod(index, len(seq))
+        values.append(seq[digit])
+    return tuple(values)
+
+
+def space_size(choices):
+    """Number of combinations in the segment spanned by ``choices``."""
+    size = 1
+    for seq in choices:
+        size *= len(seq)
+    return size
+
+
+class QuestionSpace:
+    """A topic's questions as weighted segments of ``(key, weight, choices)``."""
+
+    def __init__(self, name, segments):
+        self.name = name
+        self.keys = tuple(key for key, _, _ in segments)
+        self.weights = tuple(weight for _, weight, _ in segments)
+        self.choices = tuple(tuple(choices) for _, _, choices in segments)
+        self.sizes = tuple(space_size(choices) for choices in self.choices)
+        self.size = sum(self.sizes)
+        self._cum_weights = list(accumulate(self.weights))
+        self._segments = range(len(self.keys))
+
+
+class QuestionCursor:
+    """A player's position in a full-period pseudo-random walk over each segment."""
+
+    def __init__(self, seed=None):
+        self.seed = random.getrandbits(64) if seed is None else seed
+        # key -> [size, mask, shift, a, c, mult, x, served, epoch]
+        self._walks = {}
+
+    def _new_walk(self, key, size, epoch):
+        rng = random.Random(f"{self.seed}:{key!r}:{epoch}")
+        bits = max(2, (size - 1).bit_length())
+        mask = (1 << bits) - 1
+        a = ((rng.getrandbits(bits) << 3) | 5) & mask  # a % 4 == 1 for a full period
+        c = rng.getrandbits(bits) | 1  # c odd for a full period
+        mult = rng.getrandbits(bits) | 1
+        return [size, mask, bits // 2 + 1, a, c & mask, mult, rng.getrandbits(bits), 0, epoch]
+
+    def _restart(self, key, size):
+        walk = self._walks.get(key)
+        self._walks[key] = self._new_walk(key, size, 0 if walk is None else walk[8] + 1)
+
+    def next_index(self, key, size):
+        """Return the next unseen index in ``range(size)`` for segment ``key``."""
+        walk = self._walks.get(key)
+        if walk is None or walk[0] != size:
+            walk = self._walks[key] = self._new_walk(key, size, 0)
+        elif walk[7] >= size:
+            # Every combination served; start a fresh order
+            walk = self._walks[key] = self._new_walk(key, size, walk[8] + 1)
+        _, mask, shift, a, c, mult, x, served, _ = walk
+        while True:
+            x = (a * x + c) & mask
+            y = x ^ (x >> shift)
+            y = (y * mult) & mask
+            y ^= y >> shift
+            if y < size:
+                break
+        walk[6] = x
+        walk[7] = served + 1
+        return y
+
+    def draw(self, space, weights=None):
+        """Return ``(segment, index)`` for the next unseen question of ``space``.
+
+        The segment is chosen by weight among those with combinations left;
+        once every weighted segment is exhausted they all start a fresh order.
+        """
+        weights = space.weights if weights is None else weights
+        name, keys, sizes = space.name, space.keys, space.sizes
+        live = [i for i, weight in enumerate(weights)
+                if weight and self.remaining((name, keys[i])) != 0]
+        if not live:
+            live = [i for i, weight in enumerate(weights) if weight]
+            for i in live:
+                self._restart((name, keys[i]), sizes[i])
+        segment = random.choices(live, [weights[i] for i in live])[0]
+        return segment, self.next_index((name, keys[segment]), sizes[segment])
+
+    def remaining(self, key):
+        """Unseen combinations left in segment ``key`` (None if never visited)."""
+        walk = self._walks.get(key)
+        return None if walk is None else walk[0] - walk[7]
+
+
+class ReplayDraw:
+    """Cursor stand-in that always draws one ``(segment, index)``, to rebuild a question."""
+
+    def __init__(self, segment, index):
+        self.segment = segment
+        self.index = index
+
+    def draw(self, space, weights=None):
+        return self.segment, self.index
+
+
+def pick(cursor, space, weights=None):
+    """Return ``(segment key, values, qid)``: one question's parameters from ``space``.
+
+    Draws at random by segment weight when ``cursor`` is None, otherwise the
+    cursor's next unseen combination. ``weights`` overrides the segment
+    weights (a weight of 0 excludes a segment). ``qid`` is
+    ``(space.name, segment, index)``.
+    """
+    if cursor is None:
+        if weights is None:
+            segment = random.choices(space._segments, cum_weights=space._cum_weights)[0]
+        else:
+            segment = random.choices(space._segments, weights)[0]
+        index = random.randrange(space.sizes[segment])
+    else:
+        segment, index = cursor.draw(space, weights)
+    return space.keys[segment], _decode(index, space.choices[segment]), (space.name, segment, index)
@@ -0,0 +1,79 @@
+"""Compact, mergeable response-time histograms (HDR-style log buckets).
+
+Times are counted in 10 ms units. The first 16 buckets are linear
+(0-160 ms); after that every power of two is split into 8 sub-buckets, so a
+bucket is never wider than ~12% of its value, up to ``MAX_UNITS`` (~11
+minutes, larger times are clamped). A histogram is a fixed ``BUCKETS``-long
+list of counts, so merging players or a whole room is element-wise addition.
+"""
+
+UNIT_SECONDS = 0.01
+_LINEAR = 16
+_SUB = 8  # sub-buckets per power of two above the linear range
+MAX_UNITS = (1 << 16) - 1
+
+
+def _index(units):
+    if units < _LINEAR:
+        return units
+    shift = units.bit_length() - 4
+    return _LINEAR + (shift - 1) * _SUB + (units >> shift) - _SUB
+
+
+def _bounds(index):
+    """``(low, high)`` in units covered by bucket ``index``."""
+    if index < _LINEAR:
+        return index, index + 1
+    shift, sub = divmod(index - _LINEAR, _SUB)
+    shift += 1
+    return (sub + _SUB) << shift, (sub + _SUB + 1) << shift
+
+
+BUCKETS = _index(MAX_UNITS) + 1
+
+
+def new_histogram():
+    """Return an empty histogram."""
+    return [0] * BUCKETS
+
+
+def record_time(histogram, seconds):
+    """Count one response of ``seconds`` in ``histogram``."""
+    units = min(max(int(seconds / UNIT_SECONDS), 0), MAX_UNITS)
+    histogram[_index(units)] += 1
+
+
+def merge_histograms(histograms):
+    """Return a new histogram summing every histogram in ``histograms``."""
+    merged = new_histogram()
+    for histogram in histograms:
+        for i, count in enumerate(histogram):
+            if count:
+                merged[i] += count
+    return merged
+
+
+def percentile(histogram, q):
+    """Approximate ``q``-th percentile (0-100) in seconds, or None if empty."""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q / 100 * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if count and seen >= rank:
+            low, high = _bounds(i)
+            return (low + high) / 2 * UNIT_SECONDS
+    low, high = _bounds(BUCKETS - 1)
+    return (low + high) / 2 * UNIT_SECONDS
+
+
+def summarize(histogram):
+    """Return ``{"answers", "p50", "p90", "p99"}`` for a histogram."""
+    return {
+        "answers": sum(histogram),
+        "p50": percentile(histogram, 50),
+        "p90": percentile(histogram, 90),
+        "p99": percentile(histogram, 99),
+    }
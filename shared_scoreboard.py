@@ -0,0 +1,387 @@
+"""Shared-memory scoreboard for running several Streamlit processes on one box.
+
+Each player owns a fixed-width slot in a ``multiprocessing.shared_memory``
+block, found by open addressing on a CRC32 of their name. Writers take a
+per-slot byte-range lock (``fcntl.lockf`` on a side lock file) and bump a
+sequence counter around the write, so readers in any process get a
+consistent slot without locking. Dirty slots are mirrored to the state file
+every ``SCOREBOARD_SYNC_SECONDS`` by a timer thread in each process, so
+scores reach the disk even when nobody is answering.
+
+Rolling-window points and response-time histograms do not fit a fixed slot,
+so each process buffers its own (points per minute, one histogram per
+topic) and merges them into the state file on its next timer tick (at most
+``SCOREBOARD_SYNC_SECONDS`` later) and on exit.
+
+Enable with ``SHARED_SCOREBOARD=1``. Without ``fcntl`` (Windows) the locks
+only cover threads of one process.
+"""
+import atexit
+import os
+import struct
+import tempfile
+import time
+import zlib
+from multiprocessing import shared_memory
+from threading import Event, RLock, Thread, current_thread
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from response_times import new_histogram, record_time
+from shared_state import load_players, update_player_stats
+
+ENABLED = os.environ.get('SHARED_SCOREBOARD', '0') == '1'
+SHM_NAME = os.environ.get('SCOREBOARD_SHM_NAME', 'njsla_scoreboard')
+CAPACITY = int(os.environ.get('SCOREBOARD_CAPACITY', 4096))
+SYNC_SECONDS = float(os.environ.get('SCOREBOARD_SYNC_SECONDS', 10))
+# How long an attaching process waits for the creator to finish seeding
+ATTACH_TIMEOUT = float(os.environ.get('SCOREBOARD_ATTACH_TIMEOUT', 10))
+# Odd-sequence reads before a reader assumes the writer died mid-write
+_READ_RETRIES = 1000
+
+MAGIC = b'NJSB'
+NAME_BYTES = 255
+# magic, capacity, last sync time
+_HEADER = struct.Struct('<4sI8xd')
+_SYNC_TIME = struct.Struct('<d')
+_SYNC_TIME_OFFSET = 16
+_HEADER_SIZE = 32
+# sequence, dirty flag, name length, name, score, questions answered, correct answers
+_SLOT = struct.Struct(f'<IBB{NAME_BYTES}s1xqqq')
+_SEQ = struct.Struct('<I')
+_COUNTS = struct.Struct('<qqq')
+_COUNTS_OFFSET = _SLOT.size - _COUNTS.size
+
+
+def _untrack(shm):
+    """Keep the block alive after this process exits; other workers still use it."""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def _unlink(shm):
+    """Close and remove ``shm``; re-register first since unlink unregisters it."""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    shm.close()
+    shm.unlink()
+
+
+class SharedScoreboard:
+    def __init__(self, name=SHM_NAME, capacity=CAPACITY, seed=None):
+        self.name = name
+        self._local_lock = RLock()
+        # name -> {"points": {minute epoch: points}, "response_times": {topic: histogram}}
+        self._activity = {}
+        self._activity_since = None
+        self._closed = False
+        self._sync_stop = None
+        self._sync_thread = None
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), 'a+b')
+        # Retry: an attach that finds an abandoned block unlinks it, then we create
+        while True:
+            try:
+                self._create(capacity, seed)
+                break
+            except FileExistsError:
+                if self._attach():
+                    break
+
+    def _create(self, capacity, seed):
+        # Create and seed under the allocation lock, so any block found without
+        # MAGIC by a process holding that lock was abandoned by its creator
+        with self._locked(-1):
+            size = _HEADER_SIZE + _SLOT.size * capacity
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+            _untrack(self._shm)
+            self.capacity = capacity
+            try:
+                for player, info in (load_players() if seed is None else seed).items():
+                    slot = self._claim_slot(player)
+                    self._write_counts(slot, info['score'], info['questions_answered'],
+                                       info['correct_answers'], dirty=False)
+                _HEADER.pack_into(self._shm.buf, 0, MAGIC, capacity, time.time())
+            except BaseException:
+                # Never leave an unseeded block behind for other workers to wait on
+                _unlink(self._shm)
+                raise
+
+    def _attach(self):
+        """Attach to the existing block; False if it was gone or abandoned unseeded."""
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        _untrack(self._shm)
+        # Wait for the creating process to finish seeding
+        deadline = time.monotonic() + ATTACH_TIMEOUT
+        while bytes(self._shm.buf[:4]) != MAGIC and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if bytes(self._shm.buf[:4]) != MAGIC:
+            with self._locked(-1):
+                # Recheck under the lock: the block may have been replaced meanwhile
+                self._shm.close()
+                try:
+                    self._shm = shared_memory.SharedMemory(name=self.name)
+                except FileNotFoundError:
+                    return False
+                _untrack(self._shm)
+                if bytes(self._shm.buf[:4]) != MAGIC:
+                    _unlink(self._shm)
+                    return False
+        self.capacity = _HEADER.unpack_from(self._shm.buf, 0)[1]
+        return True
+
+    def _locked(self, slot):
+        """Exclusive lock on ``slot`` (-1 locks slot allocation and syncing)."""
+        return _SlotLock(self, slot + 1)
+
+    def _offset(self, slot):
+        return _HEADER_SIZE + slot * _SLOT.size
+
+    def _find_slot(self, player_name, claim=False):
+        """Return the slot index for ``player_name`` or None if absent."""
+        encoded = player_name.encode('utf-8')
+        if len(encoded) > NAME_BYTES:
+            raise ValueError(f"Player name longer than {NAME_BYTES} bytes")
+        buf = self._shm.buf
+        start = zlib.crc32(encoded) % self.capacity
+        for i in range(self.capacity):
+            slot = (start + i) % self.capacity
+            offset = self._offset(slot)
+            name_len = buf[offset + 5]
+            if name_len == 0:
+                if not claim:
+                    return None
+                # Name before length so readers never see a partial name
+                buf[offset + 6:offset + 6 + len(encoded)] = encoded
+                buf[offset + 5] = len(encoded)
+                return slot
+            if bytes(buf[offset + 6:offset + 6 + name_len]) == encoded:
+                return slot
+        if claim:
+            raise RuntimeError("Shared scoreboard is full; raise SCOREBOARD_CAPACITY")
+        return None
+
+    def _claim_slot(self, player_name):
+        return self._find_slot(player_name, claim=True)
+
+    def _write_counts(self, slot, score, questions, correct, dirty=True):
+        buf = self._shm.buf
+        offset = self._offset(slot)
+        seq = _SEQ.unpack_from(buf, offset)[0]
+        _SEQ.pack_into(buf, offset, seq + 1)
+        buf[offset + 4] = 1 if dirty else 0
+        _COUNTS.pack_into(buf, offset + _COUNTS_OFFSET, score, questions, correct)
+        _SEQ.pack_into(buf, offset, seq + 2)
+
+    def _read_counts(self, slot, locked=False):
+        """Read a slot's counts; ``locked`` means the caller holds the slot lock."""
+        buf = self._shm.buf
+        offset = self._offset(slot)
+        for _ in range(_READ_RETRIES):
+            seq = _SEQ.unpack_from(buf, offset)[0]
+            if seq & 1:
+                if locked:
+                    break  # no live writer can be mid-write
+                continue
+            counts = _COUNTS.unpack_from(buf, offset + _COUNTS_OFFSET)
+            if _SEQ.unpack_from(buf, offset)[0] == seq:
+                return counts
+        if not locked:
+            with self._locked(slot):
+                return self._read_counts(slot, locked=True)
+        # Holding the lock, an odd sequence means a writer died mid-write
+        seq = _SEQ.unpack_from(buf, offset)[0]
+        if seq & 1:
+            _SEQ.pack_into(buf, offset, seq + 1)
+        return _COUNTS.unpack_from(buf, offset + _COUNTS_OFFSET)
+
+    def ensure_player(self, player_name, info):
+        """Give ``player_name`` a slot seeded from ``info`` if they have none."""
+        if self._find_slot(player_name) is not None:
+            return
+        with self._locked(-1):
+            if self._find_slot(player_name) is None:
+                slot = self._claim_slot(player_name)
+                self._write_counts(slot, info['score'], info['questions_answered'],
+                                   info['correct_answers'], dirty=False)
+
+    def add(self, player_name, points, questions=1, correct=0, topic=None, time_taken=None):
+        """Add to a player's counters and return the new ``(score, questions, correct)``.
+
+        ``points`` also count towards the player's rolling windows, and with
+        ``topic`` and ``time_taken`` the answer time goes into their histogram.
+        """
+        slot = self._find_slot(player_name)
+        if slot is None:
+            with self._locked(-1):
+                slot = self._claim_slot(player_name)
+        with self._locked(slot):
+            score, answered, right = self._read_counts(slot, locked=True)
+            counts = (score + points, answered + questions, right + correct)
+            self._write_counts(slot, *counts)
+        self._record_activity(player_name, points, topic, time_taken)
+        self.maybe_sync()
+        return counts
+
+    def _record_activity(self, player_name, points, topic, time_taken):
+        timed = topic is not None and time_taken is not None
+        if not points and not timed:
+            return
+        now = time.time()
+        with self._local_lock:
+            if not self._activity:
+                self._activity_since = now
+            activity = self._activity.setdefault(player_name, {})
+            if points:
+                minutes = activity.setdefault('points', {})
+                minute = int(now // 60)
+                minutes[minute] = minutes.get(minute, 0) + points
+            if timed:
+                histograms = activity.setdefault('response_times', {})
+                if topic not in histograms:
+                    histograms[topic] = new_histogram()
+                record_time(histograms[topic], time_taken)
+
+    def get(self, player_name):
+        """Return ``(score, questions, correct)`` for a player or None."""
+        slot = self._find_slot(player_name)
+        return None if slot is None else self._read_counts(slot)
+
+    def snapshot(self):
+        """Return ``{name: {score, questions_answered, correct_answers}}`` for every slot."""
+        buf = self._shm.buf
+        players = {}
+        for slot in range(self.capacity):
+            offset = self._offset(slot)
+            name_len = buf[offset + 5]
+            if name_len == 0:
+                continue
+            name = bytes(buf[offset + 6:offset + 6 + name_len]).decode('utf-8')
+            score, questions, correct = self._read_counts(slot)
+            players[name] = {
+                "score": score,
+                "questions_answered": questions,
+                "correct_answers": correct
+            }
+        return players
+
+    def maybe_sync(self, interval=SYNC_SECONDS):
+        """Sync if ``interval`` seconds passed since the last sync by any process,
+        or since this process buffered activity it has not written yet."""
+        now = time.time()
+        if (now - _SYNC_TIME.unpack_from(self._shm.buf, _SYNC_TIME_OFFSET)[0] >= interval
+                or self._activity and now - self._activity_since >= interval):
+            self.sync()
+
+    def sync(self):
+        """Mirror all dirty slots and this process's buffered activity to the state file in one write."""
+        if self._closed:
+            return
+        buf = self._shm.buf
+        with self._locked(-1):
+            dirty = {}
+            for slot in range(self.capacity):
+                offset = self._offset(slot)
+                name_len = buf[offset + 5]
+                if name_len == 0 or not buf[offset + 4]:
+                    continue
+                with self._locked(slot):
+                    buf[offset + 4] = 0
+                    score, questions, correct = self._read_counts(slot, locked=True)
+                name = bytes(buf[offset + 6:offset + 6 + name_len]).decode('utf-8')
+                dirty[name] = {
+                    "score": score,
+                    "questions_answered": questions,
+                    "correct_answers": correct
+                }
+            with self._local_lock:
+                activity, self._activity = self._activity, {}
+            if dirty or activity:
+                update_player_stats(dirty, activity)
+            _SYNC_TIME.pack_into(buf, _SYNC_TIME_OFFSET, time.time())
+
+    def clear(self):
+        """Empty every slot (used by Reset Game)."""
+        with self._locked(-1):
+            self._shm.buf[_HEADER_SIZE:] = bytes(len(self._shm.buf) - _HEADER_SIZE)
+            self._activity.clear()
+
+    def start_sync_thread(self, interval=SYNC_SECONDS):
+        """Call :meth:`maybe_sync` every ``interval`` seconds until :meth:`close`."""
+        if self._sync_thread is not None:
+            return
+        self._sync_stop = Event()
+        self._sync_thread = Thread(target=self._sync_loop, args=(interval,),
+                                   name=f"{self.name}-sync", daemon=True)
+        self._sync_thread.start()
+
+    def _sync_loop(self, interval):
+        while not self._sync_stop.wait(interval):
+            try:
+                # Buffered activity is only written by this process, so flush it every tick
+                if self._activity:
+                    self.sync()
+                else:
+                    self.maybe_sync(interval)
+            except Exception:
+                pass  # e.g. the state file is briefly unwritable; the next tick retries
+
+    def close(self):
+        """Stop the sync thread, write out buffered activity and detach from the block."""
+        if self._closed:
+            return
+        if self._sync_thread is not None:
+            self._sync_stop.set()
+            if self._sync_thread is not current_thread():
+                self._sync_thread.join()
+        atexit.unregister(self.sync)
+        self.sync()
+        self._closed = True
+        self._shm.close()
+        self._lock_file.close()
+
+
+class _SlotLock:
+    """Thread lock plus an ``fcntl`` byte-range lock on one byte of the lock file."""
+
+    def __init__(self, board, byte):
+        self.board = board
+        self.byte = byte
+
+    def __enter__(self):
+        self.board._local_lock.acquire()
+        if fcntl is not None:
+            fcntl.lockf(self.board._lock_file, fcntl.LOCK_EX, 1, self.byte)
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.lockf(self.board._lock_file, fcntl.LOCK_UN, 1, self.byte)
+        self.board._local_lock.release()
+
+
+_scoreboard = None
+
+
+def get_scoreboard():
+    """Return this process's scoreboard, or None when ``SHARED_SCOREBOARD`` is off."""
+    global _scoreboard
+    if not ENABLED:
+        return None
+    if _scoreboard is None:
+        _scoreboard = SharedScoreboard()
+        # Keep the state file current while nobody answers, and write out
+        # buffered activity when the server stops
+        _scoreboard.start_sync_thread()
+        atexit.register(_scoreboard.sync)
+    return _scoreboard
@@ -1,18 +1,97 @@
+import csv
+import gzip
+import io
 import json
 import os
-from threading import Lock
+import shutil
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from threading import RLock
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from game_engine import new_player
+from response_times import merge_histograms
+from state_format import decode_players, encode_players
+from windowed_scores import add_points, new_windows
 
 # Simple file-backed shared players storage. Atomic writes via temp+rename.
-_lock = Lock()
-STATE_FILE = os.path.join(os.path.dirname(__file__), 'shared_players.json')
+# Every write happens under _lock, which also holds an flock on LOCK_FILE so
+# several server processes never interleave read-modify-write cycles.
+LOCK_FILE = os.path.join(os.path.dirname(__file__), 'shared_players.lock')
+# 'binary' (default) uses the compact versioned format in state_format.py;
+# 'json' keeps the original pretty-printed JSON file.
+STATE_FORMAT = os.environ.get('STATE_FORMAT', 'binary')
+JSON_STATE_FILE = os.path.join(os.path.dirname(__file__), 'shared_players.json')
+BINARY_STATE_FILE = os.path.join(os.path.dirname(__file__), 'shared_players.bin')
+STATE_FILE = BINARY_STATE_FILE if STATE_FORMAT == 'binary' else JSON_STATE_FILE
+# Players idle longer than the TTL are moved out of the state file into
+# gzip-compressed archive segments and restored when they rejoin by name.
+# A player's segment is picked by name hash, so a restore only reads and
+# rewrites one small segment however long the history is.
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), 'shared_players_archive')
+ARCHIVE_SEGMENTS = 64
+PLAYER_TTL_SECONDS = float(os.environ.get('PLAYER_TTL_DAYS', 30)) * 24 * 3600
 
 
-def load_players():
-    """Load players dict from disk. Returns empty dict if file missing or invalid."""
+class _StateLock:
+    """Re-entrant across threads, exclusive across processes (``fcntl.flock``).
+
+    Re-entrant so load_players can migrate legacy state while a caller holds
+    it. Without ``fcntl`` (Windows) it only covers threads of one process.
+    """
+
+    def __init__(self):
+        self._thread_lock = RLock()
+        self._depth = 0
+        self._file = None
+        self._pid = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            # A forked child shares the parent's open file, and so its flock
+            if self._pid != os.getpid():
+                self._file = open(LOCK_FILE, 'a+b')
+                self._pid = os.getpid()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+
+_lock = _StateLock()
+
+
+def _atomic_write(path, data: bytes):
+    """Write ``data`` to ``path`` via a uniquely named temp file and rename."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.',
+                               suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
     try:
-        if not os.path.exists(STATE_FILE):
+        os.replace(tmp, path)
+    except Exception:
+        # fallback
+        os.remove(tmp) if os.path.exists(tmp) else None
+
+
+def _load_json_players(path):
+    """Load a JSON players file. Returns empty dict if missing or invalid."""
+    try:
+        if not os.path.exists(path):
             return {}
-        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             data = json.load(f)
             # Ensure keys and simple types
             if isinstance(data, dict):
@@ -22,25 +101,271 @@ def load_players():
     return {}
 
 
+def _migrate_json_state():
+    """Convert the legacy JSON state file to the binary format once.
+
+    The JSON file is then renamed to ``.migrated`` so a later reset or a
+    deleted binary file does not bring the old players back.
+    """
+    with _lock:
+        if os.path.exists(STATE_FILE):
+            return
+        players = _load_json_players(JSON_STATE_FILE)
+        if players:
+            _write_players(players)
+            os.replace(JSON_STATE_FILE, JSON_STATE_FILE + '.migrated')
+
+
+def load_players():
+    """Load players dict from disk. Returns empty dict if file missing or invalid."""
+    if STATE_FORMAT != 'binary':
+        return _load_json_players(STATE_FILE)
+    if not os.path.exists(STATE_FILE):
+        _migrate_json_state()
+    try:
+        if not os.path.exists(STATE_FILE):
+            return {}
+        with open(STATE_FILE, 'rb') as f:
+            return decode_players(f.read())
+    except Exception:
+        return {}
+
+
+def _write_players(players: dict):
+    """Write players dict via temp+rename. Caller must hold ``_lock``."""
+    if STATE_FORMAT == 'binary':
+        data = encode_players(players)
+    else:
+        data = json.dumps(players, ensure_ascii=False, indent=2).encode('utf-8')
+    _atomic_write(STATE_FILE, data)
+
+
 def save_players(players: dict):
     """Save players dict to disk atomically."""
-    tmp = STATE_FILE + '.tmp'
     with _lock:
-        with open(tmp, 'w', encoding='utf-8') as f:
-            json.dump(players, f, ensure_ascii=False, indent=2)
-        try:
-            os.replace(tmp, STATE_FILE)
-        except Exception:
-            # fallback
-            os.remove(tmp) if os.path.exists(tmp) else None
+        _write_players(players)
+
+
+def _archive_segment(player_name: str):
+    return zlib.crc32(player_name.encode('utf-8')) % ARCHIVE_SEGMENTS
+
+
+def _segment_path(segment: int):
+    return os.path.join(ARCHIVE_DIR, f'segment-{segment:02d}.json.gz')
+
+
+def _load_archive_segment(segment: int):
+    """Load one archive segment. Returns empty dict if missing or invalid."""
+    path = _segment_path(segment)
+    try:
+        if not os.path.exists(path):
+            return {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+            if isinstance(data, dict):
+                return data
+    except Exception:
+        return {}
+    return {}
+
+
+def _write_archive_segment(segment: int, archive: dict):
+    """Write one archive segment via temp+rename. Caller must hold ``_lock``."""
+    path = _segment_path(segment)
+    if not archive:
+        os.remove(path) if os.path.exists(path) else None
+        return
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    data = json.dumps(archive, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    _atomic_write(path, gzip.compress(data))
+
+
+def _group_by_segment(names):
+    segments = {}
+    for name in names:
+        segments.setdefault(_archive_segment(name), []).append(name)
+    return segments
+
+
+def _restore_from_archive(players: dict, names):
+    """Move any archived ``names`` back into ``players``. Caller must hold ``_lock``.
+
+    Only the segments those names hash to are read. Returns the list of
+    restored names.
+    """
+    missing = [name for name in names if name not in players]
+    restored = []
+    now = time.time()
+    for segment, segment_names in _group_by_segment(missing).items():
+        if not os.path.exists(_segment_path(segment)):
+            continue
+        archive = _load_archive_segment(segment)
+        found = False
+        for name in segment_names:
+            info = archive.pop(name, None)
+            if info is not None:
+                info['last_active'] = now
+                players[name] = info
+                restored.append(name)
+                found = True
+        if found:
+            _write_archive_segment(segment, archive)
+    return restored
+
+
+def archive_inactive_players(ttl: float = None, now: float = None):
+    """Move players idle longer than ``ttl`` seconds into the compressed archive segments.
+
+    Players without a ``last_active`` stamp (saved before retention existed)
+    are stamped now rather than evicted. Returns the hot players dict.
+    """
+    ttl = PLAYER_TTL_SECONDS if ttl is None else ttl
+    now = time.time() if now is None else now
+    cutoff = now - ttl
+    with _lock:
+        players = load_players()
+        idle = {}
+        stamped = False
+        for name, info in players.items():
+            last_active = info.get('last_active')
+            if last_active is None:
+                info['last_active'] = now
+                stamped = True
+            elif last_active < cutoff:
+                idle[name] = info
+        for segment, segment_names in _group_by_segment(idle).items():
+            archive = _load_archive_segment(segment)
+            for name in segment_names:
+                archive[name] = players.pop(name)
+            _write_archive_segment(segment, archive)
+        if idle or stamped:
+            _write_players(players)
+    return players
+
+
+def restore_player(player_name: str):
+    """Restore an archived player into the hot state. Returns their info or None."""
+    with _lock:
+        players = load_players()
+        if _restore_from_archive(players, [player_name]):
+            _write_players(players)
+            return players[player_name]
+    return None
+
+
+def update_player_stats(stats: dict, activity: dict = None):
+    """Apply ``{name: {field: value}}`` updates in one read and one atomic write.
+
+    Used to mirror the shared-memory scoreboard to disk. ``activity`` maps
+    names to ``{"points": {minute epoch: points}, "response_times": {topic:
+    histogram}}`` gathered since the last write; it is merged into the
+    player's rolling windows and histograms instead of replacing them.
+    Players missing from the state file are created.
+    """
+    now = time.time()
+    with _lock:
+        players = load_players()
+        for name, fields in stats.items():
+            info = players.get(name)
+            if info is None:
+                info = players[name] = new_player()
+            info.update(fields)
+            info['last_active'] = now
+        for name, pending in (activity or {}).items():
+            info = players.get(name)
+            if info is None:
+                info = players[name] = new_player()
+            if pending.get('points'):
+                windows = info.setdefault('windows', new_windows())
+                for minute, points in sorted(pending['points'].items()):
+                    add_points(windows, points, minute * 60)
+            if pending.get('response_times'):
+                histograms = info.setdefault('response_times', {})
+                for topic, counts in pending['response_times'].items():
+                    histograms[topic] = merge_histograms([histograms.get(topic, ()), counts])
+            info['last_active'] = now
+        _write_players(players)
+    return players
 
 
 def reset_players():
-    save_players({})
+    with _lock:
+        _write_players({})
+        shutil.rmtree(ARCHIVE_DIR, ignore_errors=True)
 
 
 def add_or_update_player(player_name: str, info: dict):
-    players = load_players()
-    players[player_name] = info
-    save_players(players)
+    info['last_active'] = time.time()
+    with _lock:
+        players = load_players()
+        players[player_name] = info
+        _write_players(players)
     return players
+
+
+_FIRST_NAME_WORDS = ('first', 'given', 'forename')
+_LAST_NAME_WORDS = ('last', 'surname', 'family')
+
+
+def parse_roster(text: str):
+    """Parse a roster into a list of unique player names.
+
+    Accepts one name per line or a CSV export. A first row with any column
+    containing "name" (``Name``, ``Student Name``, ``Surname``...) or a bare
+    ``First``/``Last`` is treated as a header. First- and last-name columns
+    (``First``/``Given``/``Forename`` and ``Last``/``Surname``/``Family``)
+    are joined; otherwise a full-name column is used, or a first-name column
+    alone. Without a header the first column is used.
+
+    Raises ValueError for a header with only a last-name column, which would
+    merge every student sharing a surname.
+    """
+    rows = [row for row in csv.reader(io.StringIO(text)) if row and any(c.strip() for c in row)]
+    if not rows:
+        return []
+    header = [c.strip().lower() for c in rows[0]]
+    first = [i for i, h in enumerate(header) if any(word in h for word in _FIRST_NAME_WORDS)
+             and ('name' in h or h in _FIRST_NAME_WORDS)]
+    last = [i for i, h in enumerate(header) if any(word in h for word in _LAST_NAME_WORDS)
+            and ('name' in h or h in _LAST_NAME_WORDS)]
+    full = [i for i, h in enumerate(header) if 'name' in h and i not in first and i not in last]
+    cols = [0]
+    if first or last or full:
+        rows = rows[1:]
+        if first and last:
+            cols = [first[0], last[0]]
+        elif full or first:
+            cols = (full or first)[:1]
+        else:
+            raise ValueError("Roster has a last-name column but no first-name or full-name column")
+    names = []
+    seen = set()
+    for row in rows:
+        name = ' '.join(row[col].strip() for col in cols if col < len(row) and row[col].strip())
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def add_players(names, join_time=None):
+    """Register many players in a single read and a single atomic write.
+
+    Existing players are left untouched and archived players are restored.
+    Returns ``(players, added)`` where ``added`` lists the names that were
+    newly inserted.
+    """
+    join_time = join_time or datetime.now().strftime("%H:%M:%S")
+    now = time.time()
+    with _lock:
+        players = load_players()
+        restored = _restore_from_archive(players, names)
+        added = []
+        for name in names:
+            if name not in players:
+                players[name] = new_player(join_time)
+                players[name]['last_active'] = now
+                added.append(name)
+        if added or restored:
+            _write_players(players)
+    return players, added
@@ -0,0 +1,226 @@
+"""Compact, versioned binary encoding for the shared players table.
+
+Layout (little-endian)::
+
+    header   magic b'NJSP', version u16, player count u32, string table bytes u32
+    counts   (version 3+) ring table entries u32, histogram table entries u32
+    rows     one fixed-width row per player (see ``_ROW_V4``)
+    strings  UTF-8 player names, join times, topic names and extra fields,
+             concatenated; rows and histograms hold (offset, length)
+    rings    (version 2+) fixed-width rolling-window rings, one per player
+             that has any; rows hold the ring index or ``_NO_RINGS``
+    hists    (version 3+) fixed-width response-time histograms, one per
+             player and topic; rows hold the first index and how many
+
+Each row stores score, questions answered, correct answers, ``last_active``
+(NaN when unset) and the join time. Rings hold each ``windowed_scores.RINGS``
+head epoch followed by its buckets; histograms hold a topic name and
+``response_times.BUCKETS`` counts. Any other keys are kept as one JSON object
+per player (version 4; earlier versions dropped them and cut join times to
+8 bytes). Older versions are still decoded.
+"""
+import json
+import math
+import struct
+
+from response_times import BUCKETS
+from windowed_scores import RINGS
+
+MAGIC = b'NJSP'
+FORMAT_VERSION = 4
+
+_HEADER = struct.Struct('<4sHII')
+_COUNTS_V3 = struct.Struct('<II')
+# name offset, name length, score, questions answered, correct answers, last_active, join_time
+_ROW_V1 = struct.Struct('<IHiIId8s')
+# version 1 fields plus the player's index in the ring table
+_ROW_V2 = struct.Struct('<IHiIId8sI')
+# version 2 fields plus the player's first histogram index and histogram count
+_ROW_V3 = struct.Struct('<IHiIId8sIIH')
+# name offset, name length, score, questions answered, correct answers, last_active,
+# join_time offset, join_time length, ring index, first histogram index, histogram count,
+# extra fields offset, extra fields length (0 when the player has none)
+_ROW_V4 = struct.Struct('<IHiIIdIHIIHII')
+# Keys with a fixed place in a row, ring or histogram; the rest go in the extra fields
+_ROW_KEYS = frozenset(('score', 'questions_answered', 'correct_answers', 'last_active', 'join_time',
+                       'windows', 'response_times'))
+_NO_RINGS = 0xFFFFFFFF
+_RING_SIZES = tuple(count for _, count in RINGS.values())
+# each ring's head epoch followed by its buckets
+_RINGS_V2 = struct.Struct('<' + ''.join(f'I{count}I' for count in _RING_SIZES))
+# topic name offset, topic name length, bucket counts
+_HIST_V3 = struct.Struct(f'<IH{BUCKETS}I')
+
+
+def encode_players(players: dict):
+    """Encode a players dict to bytes in the current format version."""
+    strings = bytearray()
+    # topic names and join times repeat across players; store each once
+    interned = {}
+    rows = bytearray(_ROW_V4.size * len(players))
+    rings = []
+    hists = []
+    pack_into = _ROW_V4.pack_into
+    pack_rings = _RINGS_V2.pack
+    pack_hist = _HIST_V3.pack
+    nan = math.nan
+
+    def intern(text):
+        if text not in interned:
+            encoded = text.encode('utf-8')
+            interned[text] = (len(strings), len(encoded))
+            strings.extend(encoded)
+        return interned[text]
+
+    offset = 0
+    for name, info in players.items():
+        encoded = name.encode('utf-8')
+        last_active = info.get('last_active')
+        windows = info.get('windows')
+        ring_index = _NO_RINGS
+        if windows:
+            ring_index = len(rings)
+            rings.append(pack_rings(*[v for ring in RINGS for v in [windows[ring][0], *windows[ring][1]]]))
+        response_times = info.get('response_times') or {}
+        hist_start = len(hists)
+        for topic, counts in response_times.items():
+            hists.append(pack_hist(*intern(topic), *counts))
+        join_off, join_len = intern(str(info.get('join_time', '')))
+        extra_off = extra_len = 0
+        extras = {key: value for key, value in info.items() if key not in _ROW_KEYS}
+        if extras:
+            blob = json.dumps(extras, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            extra_off, extra_len = len(strings), len(blob)
+            strings += blob
+        pack_into(rows, offset,
+                  len(strings), len(encoded),
+                  int(info.get('score', 0)),
+                  int(info.get('questions_answered', 0)),
+                  int(info.get('correct_answers', 0)),
+                  nan if last_active is None else last_active,
+                  join_off, join_len,
+                  ring_index, hist_start, len(response_times),
+                  extra_off, extra_len)
+        strings += encoded
+        offset += _ROW_V4.size
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(players), len(strings))
+    return b''.join((header, _COUNTS_V3.pack(len(rings), len(hists)), rows, strings, *rings, *hists))
+
+
+def _decode_rows(data: bytes, count: int, strings_len: int, row: struct.Struct, rows_start=_HEADER.size):
+    """Yield ``(name, info, extra_fields, strings)`` for each row of a ``row``-shaped table."""
+    strings_start = rows_start + row.size * count
+    strings = data[strings_start:strings_start + strings_len]
+    if len(strings) != strings_len:
+        raise ValueError("Truncated player state")
+    isnan = math.isnan
+    for fields in row.iter_unpack(data[rows_start:strings_start]):
+        name_off, name_len, score, questions, correct, last_active, join_time = fields[:7]
+        info = {
+            "score": score,
+            "questions_answered": questions,
+            "correct_answers": correct,
+            "join_time": join_time.rstrip(b'\0').decode('ascii')
+        }
+        if not isnan(last_active):
+            info['last_active'] = last_active
+        yield strings[name_off:name_off + name_len].decode('utf-8'), info, fields[7:], strings
+
+
+def _unpack_windows(data: bytes, offset: int):
+    values = _RINGS_V2.unpack_from(data, offset)
+    windows = {}
+    pos = 0
+    for ring, size in zip(RINGS, _RING_SIZES):
+        windows[ring] = [values[pos], list(values[pos + 1:pos + 1 + size])]
+        pos += size + 1
+    return windows
+
+
+def _unpack_histograms(data: bytes, hists_start: int, first: int, count: int, strings: bytes):
+    response_times = {}
+    for i in range(first, first + count):
+        topic_off, topic_len, *counts = _HIST_V3.unpack_from(data, hists_start + i * _HIST_V3.size)
+        response_times[strings[topic_off:topic_off + topic_len].decode('utf-8')] = counts
+    return response_times
+
+
+def _decode_v1(data: bytes, count: int, strings_len: int):
+    return {name: info for name, info, _, _ in _decode_rows(data, count, strings_len, _ROW_V1)}
+
+
+def _decode_v2(data: bytes, count: int, strings_len: int):
+    rings_start = _HEADER.size + _ROW_V2.size * count + strings_len
+    players = {}
+    for name, info, (ring_index,), _ in _decode_rows(data, count, strings_len, _ROW_V2):
+        if ring_index != _NO_RINGS:
+            info['windows'] = _unpack_windows(data, rings_start + ring_index * _RINGS_V2.size)
+        players[name] = info
+    return players
+
+
+def _decode_v3(data: bytes, count: int, strings_len: int):
+    ring_count, _ = _COUNTS_V3.unpack_from(data, _HEADER.size)
+    rows_start = _HEADER.size + _COUNTS_V3.size
+    rings_start = rows_start + _ROW_V3.size * count + strings_len
+    hists_start = rings_start + _RINGS_V2.size * ring_count
+    players = {}
+    for name, info, (ring_index, hist_start, hist_count), strings in _decode_rows(
+            data, count, strings_len, _ROW_V3, rows_start):
+        if ring_index != _NO_RINGS:
+            info['windows'] = _unpack_windows(data, rings_start + ring_index * _RINGS_V2.size)
+        if hist_count:
+            info['response_times'] = _unpack_histograms(data, hists_start, hist_start, hist_count, strings)
+        players[name] = info
+    return players
+
+
+def _decode_v4(data: bytes, count: int, strings_len: int):
+    ring_count, _ = _COUNTS_V3.unpack_from(data, _HEADER.size)
+    rows_start = _HEADER.size + _COUNTS_V3.size
+    strings_start = rows_start + _ROW_V4.size * count
+    strings = data[strings_start:strings_start + strings_len]
+    if len(strings) != strings_len:
+        raise ValueError("Truncated player state")
+    rings_start = strings_start + strings_len
+    hists_start = rings_start + _RINGS_V2.size * ring_count
+    isnan = math.isnan
+    players = {}
+    for (name_off, name_len, score, questions, correct, last_active, join_off, join_len,
+         ring_index, hist_start, hist_count, extra_off, extra_len) in _ROW_V4.iter_unpack(
+            data[rows_start:strings_start]):
+        info = {
+            "score": score,
+            "questions_answered": questions,
+            "correct_answers": correct,
+            "join_time": strings[join_off:join_off + join_len].decode('utf-8')
+        }
+        if not isnan(last_active):
+            info['last_active'] = last_active
+        if ring_index != _NO_RINGS:
+            info['windows'] = _unpack_windows(data, rings_start + ring_index * _RINGS_V2.size)
+        if hist_count:
+            info['response_times'] = _unpack_histograms(data, hists_start, hist_start, hist_count, strings)
+        if extra_len:
+            info.update(json.loads(strings[extra_off:extra_off + extra_len].decode('utf-8')))
+        players[strings[name_off:name_off + name_len].decode('utf-8')] = info
+    return players
+
+
+_DECODERS = {
+    1: _decode_v1,
+    2: _decode_v2,
+    3: _decode_v3,
+    4: _decode_v4,
+}
+
+
+def decode_players(data: bytes):
+    """Decode bytes produced by :func:`encode_players` (any known version)."""
+    magic, version, count, strings_len = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary player state file")
+    decoder = _DECODERS.get(version)
+    if decoder is None:
+        raise ValueError(f"Unsupported player state version: {version}")
+    return decoder(data, count, strings_len)
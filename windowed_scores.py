@@ -0,0 +1,74 @@
+"""Rolling-window score counters kept in fixed-size time buckets.
+
+Each player carries three ring buffers: points per minute (last hour), per
+hour (last day) and per day (last 30 days). A ring is ``[head, buckets]``
+where ``head`` is the bucket epoch (``int(now // seconds)``) last written and
+bucket ``e % len(buckets)`` holds epoch ``e``. Adding points touches at most
+one ring's worth of buckets, and a window total sums at most one ring, so
+both cost the same after a day of play or a year.
+"""
+import time
+
+# ring name -> (bucket seconds, bucket count). state_format stores these
+# rings at fixed width, so changing them needs a new format version.
+RINGS = {
+    "minute": (60, 60),
+    "hour": (3600, 24),
+    "day": (86400, 30),
+}
+
+# label -> (ring, buckets summed); None is the all-time score
+LEADERBOARD_WINDOWS = {
+    "All time": None,
+    "Last 15 minutes": ("minute", 15),
+    "Last hour": ("minute", 60),
+    "Last 24 hours": ("hour", 24),
+    "Last 7 days": ("day", 7),
+    "Last 30 days": ("day", 30),
+}
+
+
+def new_windows():
+    """Return empty rings for a player."""
+    return {ring: [0, [0] * count] for ring, (_, count) in RINGS.items()}
+
+
+def add_points(windows, points, now=None):
+    """Add ``points`` to the current bucket of every ring in ``windows``."""
+    now = time.time() if now is None else now
+    for ring, (seconds, count) in RINGS.items():
+        head, buckets = windows[ring]
+        epoch = int(now // seconds)
+        if epoch > head:
+            # Clear buckets skipped since the last write (at most one lap)
+            for e in range(max(head + 1, epoch - count + 1), epoch + 1):
+                buckets[e % count] = 0
+            windows[ring][0] = epoch
+        elif epoch <= head - count:
+            continue  # older than the ring covers
+        buckets[epoch % count] += points
+
+
+def window_total(windows, ring, buckets_back, now=None):
+    """Points in the last ``buckets_back`` buckets of ``ring`` (including the current one)."""
+    if not windows:
+        return 0
+    now = time.time() if now is None else now
+    seconds, count = RINGS[ring]
+    head, buckets = windows[ring]
+    epoch = int(now // seconds)
+    first = max(epoch - min(buckets_back, count) + 1, head - count + 1)
+    return sum(buckets[e % count] for e in range(first, min(epoch, head) + 1))
+
+
+def windowed_leaderboard(players, window, now=None):
+    """Return ``[(name, points), ...]`` best first for a ``LEADERBOARD_WINDOWS`` label."""
+    spec = LEADERBOARD_WINDOWS[window]
+    if spec is None:
+        standings = [(name, data['score']) for name, data in players.items()]
+    else:
+        ring, buckets_back = spec
+        now = time.time() if now is None else now
+        standings = [(name, window_total(data.get('windows'), ring, buckets_back, now))
+                     for name, data in players.items()]
+    return sorted(standings, key=lambda x: x[1], reverse=True)